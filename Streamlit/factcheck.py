@@ -1,6 +1,7 @@
+import os
+import sys
 import streamlit as st
 from PIL import Image
-import easyocr
 from youtube_transcript_api import YouTubeTranscriptApi as yta
 import numpy as np
 import requests
@@ -8,23 +9,37 @@ from bs4 import BeautifulSoup
 import pandas as pd
 import csv
 from googlesearch import search
-import nltk
 import re
-from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
-import google.generativeai as genai
+# easyocr and google.generativeai are imported on first use; Streamlit reruns
+# this script on every interaction, so the cached loaders below build each
+# client once per process instead
 
-genai.configure(api_key=key) #the key has been hidden due to privancy reasons
-model = genai.GenerativeModel("gemini-1.5-flash")
+# NLTK data is resolved from the repo's nltk_data/ by the shared helper in the repo root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+from nltk_resources import english_stop_words  # noqa: E402
 
-# NLTK setup
-# nltk.download('punkt')
-nltk.download('punkt_tab')
-nltk.download('stopwords')
+@st.cache_resource
+def get_gemini_model():
+    """Configure Gemini once per process."""
+    import google.generativeai as genai
+
+    # The API key is read from the GEMINI_API_KEY environment variable
+    genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+    return genai.GenerativeModel("gemini-1.5-flash")
+
+@st.cache_resource
+def get_ocr_reader():
+    """Load the EasyOCR English model once per process."""
+    import easyocr
+
+    return easyocr.Reader(['en'])
 
 def extract_text_from_image(image):
     """Extract text from the given image using EasyOCR."""
-    reader = easyocr.Reader(['en'])  # Initialize EasyOCR reader
+    reader = get_ocr_reader()  # Initialize EasyOCR reader
     image_np = np.array(image)  # Convert PIL image to NumPy array
     results = reader.readtext(image_np)
     
@@ -36,8 +51,8 @@ def extract_keywords(query):
     """
     Extract significant keywords from the query using NLTK.
     """
+    stop_words = english_stop_words()
     words = word_tokenize(query)
-    stop_words = set(stopwords.words('english'))
     keywords = [word for word in words if word.isalpha() and word.lower() not in stop_words]
     return keywords
 
@@ -107,7 +122,7 @@ def get_overall_summary(corpus):
     # combined_corpus = "\n".join(corpus)  # Combine all the content
     print("Sending content to gemini API for summarization...\n")
     
-    response = model.generate_content(f"Tell whether the news: {corpus} is fake or not and why")
+    response = get_gemini_model().generate_content(f"Tell whether the news: {corpus} is fake or not and why")
     print(response.text)
     return response.text
     # response = ai.prompt(message=f"Tell whether the news: {corpus} is fake or not and why.")
@@ -129,7 +144,7 @@ def fixed(file_path, headline, output_file="table.csv"):
             print(f"Processing URL: {url}")
             print("Sending content to gemini API for fixing...\n")
             # response = ai.prompt(message=f"In accordance to the headline: {headline}, frame 1 line that contains all the relevant information to the headline from the text: {content}.")
-            response = model.generate_content(f"In accordance to the headline: {headline}, frame 1 line that contains all the relevant information to the headline from the text: {content}.")
+            response = get_gemini_model().generate_content(f"In accordance to the headline: {headline}, frame 1 line that contains all the relevant information to the headline from the text: {content}.")
             # Append the result as a dictionary
             results.append({'URL': url, 'Response': response.text})
 
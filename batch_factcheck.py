@@ -0,0 +1,423 @@
+"""Offline batch fact-checking of archived headlines.
+
+Runs the same two phases as ``summarize.combinedPipeline`` over a JSONL or CSV
+file of headlines, tuned for throughput instead of latency:
+
+* duplicate headlines (ignoring case and whitespace) are only scored once,
+* searches and page scrapes run concurrently over a pooled HTTP session, and
+  the pages for the next batch are fetched while the current one generates,
+* the model is loaded once and prompts are generated in batches.
+
+Results are appended to a JSONL file as each batch finishes. That file doubles
+as the checkpoint: rerunning the same command skips every headline already in
+it, so a killed run resumes where it stopped. Headlines whose search failed
+after its retries, or whose source pages all failed to download, are written
+with an ``error`` field instead of being scored, and are tried again on resume.
+
+Usage:
+    python batch_factcheck.py headlines.jsonl -o results.jsonl
+    python batch_factcheck.py archive.csv --field title --batch-size 4
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from telemetry import REGISTRY, span
+# requests and summarize (and through it the ML stack) are imported where they
+# are used, so the pure helpers here import without them
+# Every output record starts with this, which tells a cut-off record from a foreign file
+RECORD_PREFIX = b'{"id": '
+FAILED_CONTENT = ("No significant content found.", "Failed to fetch content")
+
+
+class StageTimer:
+    """Accumulate wall-clock time and call counts per pipeline stage."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            # Prefixed so batch-level stages don't mix with the per-call spans inside them
+            with span(f"batch_{name}") as current:
+                yield current
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+
+class SearchError(Exception):
+    """Searching for a headline's sources failed even after retrying."""
+
+
+class SearchLimiter:
+    """Run searches at most ``concurrency`` at a time, retrying failures with backoff.
+
+    Search engines rate-limit bursts, so searches get a smaller concurrency
+    than page downloads.
+    """
+
+    def __init__(self, search, concurrency, retries=4, backoff=2.0):
+        self.search = search
+        self.retries = retries
+        self.backoff = backoff
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def __call__(self, query):
+        for attempt in range(self.retries + 1):
+            try:
+                with self._slots, span("search") as s:
+                    results = list(self.search(query, num_results=10))
+                    s.add("results", len(results))
+                return results
+            except Exception as e:
+                if attempt == self.retries:
+                    raise SearchError(f"{type(e).__name__}: {e}") from e
+                REGISTRY.inc("livetruth_search_retries_total")
+                time.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+
+
+class PageCache:
+    """Bounded LRU of scraped page contents shared by the scraping threads.
+
+    Failed scrapes are not stored, so a transient error on a page only costs
+    the headline that hit it; the next headline citing the page fetches it again.
+    """
+
+    def __init__(self, scrape, maxsize):
+        self.scrape = scrape
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        with self._lock:
+            if url in self._pages:
+                self._pages.move_to_end(url)
+                self.hits += 1
+                REGISTRY.inc("livetruth_cache_hits_total", cache="pages")
+                return self._pages[url]
+            self.misses += 1
+        REGISTRY.inc("livetruth_cache_misses_total", cache="pages")
+
+        content = self.scrape(url)
+        if content is None or content == "Failed to fetch content":
+            return content
+        with self._lock:
+            self._pages[url] = content
+            if len(self._pages) > self.maxsize:
+                self._pages.popitem(last=False)
+        return content
+
+
+def normalise_headline(headline):
+    """Collapse whitespace and case so trivially different copies dedupe."""
+    return " ".join(headline.split()).casefold()
+
+
+def headline_id(headline):
+    return hashlib.sha1(normalise_headline(headline).encode("utf-8")).hexdigest()[:16]
+
+
+def read_headlines(path, field="headline"):
+    """Yield raw headlines from a JSONL or CSV file."""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                yield row.get(field) or ""
+        return
+
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            yield record if isinstance(record, str) else record.get(field) or ""
+
+
+def dedupe_headlines(headlines):
+    """Return ``(id, headline, occurrences)`` for each distinct headline, in input order."""
+    unique = {}
+    for headline in headlines:
+        if not headline.strip():
+            continue
+        key = headline_id(headline)
+        if key in unique:
+            unique[key][2] += 1
+        else:
+            unique[key] = [key, headline.strip(), 1]
+    return [tuple(item) for item in unique.values()]
+
+
+def load_completed(output_path):
+    """Return the ids already scored in ``output_path``; records with an ``error`` don't count.
+
+    A run killed mid-write can leave its last record without the trailing
+    newline. If that line is a complete record the newline is added;
+    otherwise the partial line is truncated, so the resumed run appends
+    cleanly. Any other line that isn't a record means ``output_path`` is not
+    this tool's output, and it is left untouched.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    offset = 0
+    partial = None
+    with open(output_path, "rb") as file:
+        for number, raw in enumerate(file, 1):
+            record = _parse_record(raw)
+            if not raw.endswith(b"\n") and (record is not None or raw.startswith(RECORD_PREFIX)):
+                partial = record
+                break
+            if record is None:
+                if raw.strip():
+                    raise ValueError(
+                        f"{output_path}:{number} is not a batch_factcheck record; refusing to resume into it"
+                    )
+            elif "error" not in record:
+                done.add(record["id"])
+            offset += len(raw)
+        size = file.tell()
+
+    if offset < size:
+        if partial is None:
+            print(f"Discarding {size - offset} bytes of incomplete output after the last full record")
+            with open(output_path, "r+b") as file:
+                file.truncate(offset)
+        else:
+            with open(output_path, "ab") as file:
+                file.write(b"\n")
+            if "error" not in partial:
+                done.add(partial["id"])
+    return done
+
+
+def _parse_record(raw):
+    """The output record on ``raw``, or None if it isn't one."""
+    try:
+        record = json.loads(raw)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) and "id" in record else None
+
+
+def make_session(pool_size):
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_batch(batch, pipeline, pool, search, scrape, timer):
+    """Search and scrape the sources for every headline of a batch concurrently.
+
+    Returns one ``(pages, error)`` pair per headline; ``error`` is None unless
+    the search failed or none of the pages it found could be downloaded.
+    """
+    def search_headline(item):
+        try:
+            return search(" ".join(pipeline.extract_keywords(item[1]))), None
+        except SearchError as e:
+            return [], f"Search failed: {e}"
+
+    with timer.stage("search"):
+        searches = list(pool.map(search_headline, batch))
+
+    with timer.stage("scrape"):
+        # The same outlet pages turn up for related headlines; fetch each once
+        urls = list(dict.fromkeys(url for url_list, _ in searches for url in url_list))
+        pages = dict(zip(urls, pool.map(scrape, urls)))
+
+    sources = []
+    for url_list, error in searches:
+        fetched = [(url, pages[url]) for url in url_list]
+        if url_list and all(content is None or content == "Failed to fetch content" for _, content in fetched):
+            error = f"All {len(url_list)} source pages failed to download"
+        sources.append((fetched, error))
+    return sources
+
+
+def generate_batch(prompts, tokenizer, model, device, max_new_tokens, generation_kwargs):
+    """Generate a response for each prompt in a single padded ``generate`` call."""
+    import torch
+
+    with span("tokenize") as s:
+        inputs = tokenizer(
+            prompts,
+            return_tensors="pt",
+            truncation=True,
+            padding=True,
+        )
+        inputs = {key: value.to(device) for key, value in inputs.items()}
+        s.add("tokens_in", int(inputs["attention_mask"].sum()))
+
+    with span("generate") as s, torch.no_grad():
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=tokenizer.pad_token_id,
+            **generation_kwargs
+        )
+        s.add("tokens_out", (outputs.shape[-1] - inputs["input_ids"].shape[-1]) * outputs.shape[0])
+
+    with span("detokenize"):
+        return [text.strip() for text in tokenizer.batch_decode(outputs, skip_special_tokens=True)]
+
+
+def score_batch(batch, sources, pipeline, models, timer):
+    """Run phase 1 and phase 2 generation for a batch and build the output records.
+
+    Headlines whose sources could not be fetched get an error record instead.
+    """
+    records = {}
+    for (key, headline, occurrences), (pages, error) in zip(batch, sources):
+        if error:
+            records[key] = {"id": key, "headline": headline, "occurrences": occurrences, "error": error}
+    scored = [(item, pages) for item, (pages, error) in zip(batch, sources) if not error]
+    if scored:
+        for record in _generate_records(scored, pipeline, models, timer):
+            records[record["id"]] = record
+    return [records[key] for key, _, _ in batch]
+
+
+def _generate_records(scored, pipeline, models, timer):
+    tokenizer, base_model, fine_tuned_model, device = models
+    batch = [item for item, _ in scored]
+    sources = [pages for _, pages in scored]
+
+    with timer.stage("phase1_generate"):
+        prompts = [pipeline.analysis_prompt(headline) for _, headline, _ in batch]
+        fine_tune_responses = generate_batch(
+            prompts, tokenizer, fine_tuned_model, device, 250, pipeline.GENERATION_KWARGS
+        )
+
+    with timer.stage("phase2_generate"):
+        prompts = []
+        for pages in sources:
+            corpus = [content for _, content in pages if content and content not in FAILED_CONTENT]
+            prompts.append(pipeline.summary_prompt(corpus))
+        summaries = generate_batch(
+            prompts, tokenizer, base_model, device, 512, pipeline.GENERATION_KWARGS
+        )
+
+    records = []
+    for (key, headline, occurrences), pages, response, summary in zip(batch, sources, fine_tune_responses, summaries):
+        start_index = summary.find(pipeline.SUMMARY_MARKER)
+        if start_index != -1:
+            summary = summary[start_index:]
+        records.append({
+            "id": key,
+            "headline": headline,
+            "occurrences": occurrences,
+            "fine_tune_response": response,
+            "news_summary": summary,
+            "sources": [url for url, _ in pages],
+        })
+    return records
+
+
+def load_models(adapter_dir):
+    """Load the tokenizer, base model and fine-tuned adapter once for the whole run."""
+    import summarize
+
+    tokenizer, base_model, device = summarize.initialise_base_model(summarize.base_model)
+    fine_tuned_model = summarize.initialise_fine_tuned_model(base_model, adapter_dir or summarize.fine_tuned_model)
+
+    # Batched decoder-only generation needs the padding on the prompt side
+    tokenizer.padding_side = "left"
+    return summarize, (tokenizer, base_model, fine_tuned_model, device)
+
+
+def report(timer, processed, failed, elapsed, cache):
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"\nProcessed {processed} headlines in {elapsed:.1f}s ({rate:.2f} headlines/sec)")
+    if failed:
+        print(f"{failed} could not be scored; rerun the same command to retry them")
+    print("Per-stage time (search and scrape overlap with generation):")
+    for name, seconds in timer.seconds.items():
+        print(f"  {name:<16} {seconds:9.1f}s  over {timer.calls[name]} batches")
+    print(f"Page cache: {cache.hits} hits, {cache.misses} misses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fact-check archived headlines in bulk.")
+    parser.add_argument("input", help="JSONL or CSV file of headlines")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl",
+                        help="JSONL file results are appended to; also used to resume")
+    parser.add_argument("--field", default="headline", help="JSON key or CSV column holding the headline")
+    parser.add_argument("--batch-size", type=int, default=8, help="headlines per generate call")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent page downloads")
+    parser.add_argument("--search-workers", type=int, default=2,
+                        help="concurrent searches; kept low to stay under search rate limits")
+    parser.add_argument("--search-retries", type=int, default=4, help="retries for a failed search, with backoff")
+    parser.add_argument("--cache-size", type=int, default=20000, help="scraped pages kept in memory")
+    parser.add_argument("--adapter-dir", help="LoRA adapter directory (default: the one summarize.py uses)")
+    args = parser.parse_args()
+
+    timer = StageTimer()
+    started = time.perf_counter()
+
+    with timer.stage("read"):
+        headlines = dedupe_headlines(read_headlines(args.input, args.field))
+        done = load_completed(args.output)
+        pending = [item for item in headlines if item[0] not in done]
+    print(f"{len(headlines)} distinct headlines, {len(headlines) - len(pending)} already done, {len(pending)} to score")
+    if not pending:
+        return
+
+    with timer.stage("load_model"):
+        pipeline, models = load_models(args.adapter_dir)
+
+    session = make_session(args.workers)
+    scrape = PageCache(lambda url: pipeline.scrape_important_content(url, session), args.cache_size)
+    # pipeline.perform_search turns errors into an empty result; go to the search
+    # function directly so failures can be retried and reported
+    search = SearchLimiter(pipeline.search, args.search_workers, retries=args.search_retries)
+    batches = [pending[i:i + args.batch_size] for i in range(0, len(pending), args.batch_size)]
+
+    processed = failed = 0
+    try:
+        with ThreadPoolExecutor(args.workers) as pool, ThreadPoolExecutor(1) as prefetcher, \
+                open(args.output, "a", encoding="utf-8") as output:
+            next_sources = prefetcher.submit(fetch_batch, batches[0], pipeline, pool, search, scrape, timer)
+            for index, batch in enumerate(batches):
+                sources = next_sources.result()
+                if index + 1 < len(batches):
+                    next_sources = prefetcher.submit(fetch_batch, batches[index + 1], pipeline, pool, search, scrape, timer)
+
+                records = score_batch(batch, sources, pipeline, models, timer)
+
+                with timer.stage("write"):
+                    output.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+                    output.flush()
+                    os.fsync(output.fileno())
+
+                processed += len(batch)
+                failed += sum(1 for record in records if "error" in record)
+                print(f"[{processed}/{len(pending)}] batch {index + 1}/{len(batches)} written")
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun the same command to resume.")
+    finally:
+        report(timer, processed, failed, time.perf_counter() - started, scrape)
+
+
+if __name__ == "__main__":
+    main()
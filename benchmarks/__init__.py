@@ -0,0 +1,7 @@
+"""Offline benchmarks for the LiveTruth pipelines.
+
+Everything here runs without network access, Gemini or a GPU: news pages are
+served by a local fixture server, Google search is replaced by a stub that
+points at those pages, and Llama-2 by a tiny randomly initialised causal LM.
+See ``python -m benchmarks.run --help``.
+"""
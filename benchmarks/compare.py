@@ -0,0 +1,52 @@
+"""Compare two benchmark reports written by ``benchmarks.run``.
+
+Usage:
+    python -m benchmarks.compare baseline.json candidate.json
+"""
+import argparse
+import json
+
+
+def load_runs(path):
+    with open(path, encoding="utf-8") as file:
+        report = json.load(file)
+    return {(run["flow"], run["concurrency"]): run for run in report["runs"]}
+
+
+def ratio(new, old):
+    if not old or new is None:
+        return "   n/a"
+    return f"{new / old:6.2f}x"
+
+
+def compare(baseline, candidate, stages=False):
+    """Print p50/p95/p99 latency and throughput ratios (candidate / baseline)."""
+    print(f"{'flow':<12} {'conc':>4}  {'p50':>7} {'p95':>7} {'p99':>7} {'rps':>7}  errors")
+    for key in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[key], candidate[key]
+        print(
+            f"{key[0]:<12} {key[1]:>4}  "
+            + " ".join(ratio(new["latency"][q], old["latency"][q]) for q in ("p50", "p95", "p99"))
+            + f" {ratio(new['throughput_rps'], old['throughput_rps'])}"
+            + f"  {old['errors']} -> {new['errors']}"
+        )
+        if stages:
+            for stage in sorted(old["stages"].keys() & new["stages"].keys()):
+                o, n = old["stages"][stage], new["stages"][stage]
+                print(f"  {stage:<22} " + " ".join(ratio(n[q], o[q]) for q in ("p50", "p95", "p99")))
+
+    for key in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{key[0]:<12} {key[1]:>4}  only in {'baseline' if key in baseline else 'candidate'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--stages", action="store_true", help="also compare per-stage latency")
+    args = parser.parse_args()
+    compare(load_runs(args.baseline), load_runs(args.candidate), stages=args.stages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Local HTTP server for the recorded news pages in ``fixtures/pages``."""
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "pages")
+
+
+class FixtureServer:
+    """Serve fixture pages on localhost with configurable latency and failures.
+
+    Each response is delayed by ``latency_ms`` plus up to ``jitter_ms``. A
+    ``failure_rate`` fraction of requests get a 503, and a ``drop_rate``
+    fraction have their connection closed without any response.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, failure_rate=0.0, drop_rate=0.0, seed=0, pages_dir=PAGES_DIR):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.pages = {}
+        for name in sorted(os.listdir(pages_dir)):
+            with open(os.path.join(pages_dir, name), "rb") as file:
+                self.pages[name] = file.read()
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def url_for(self, name):
+        return f"{self.base_url}/pages/{name}"
+
+    def urls(self):
+        return [self.url_for(name) for name in self.pages]
+
+    def _roll(self):
+        # random.Random is not safe to share between handler threads
+        with self._lock:
+            return self._random.random(), self._random.random()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                outcome, jitter = server._roll()
+                delay = server.latency_ms + jitter * server.jitter_ms
+                if delay:
+                    time.sleep(delay / 1000)
+
+                if outcome < server.drop_rate:
+                    self.close_connection = True
+                    self.connection.close()
+                    return
+                if outcome < server.drop_rate + server.failure_rate:
+                    self.send_error(503, "Injected failure")
+                    return
+
+                body = server.pages.get(self.path.rsplit("/", 1)[-1])
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
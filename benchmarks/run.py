@@ -0,0 +1,316 @@
+"""Drive the LiveTruth flows against local stand-ins and report latency.
+
+Each selected flow is run ``--requests`` times at every ``--concurrency``
+level. The JSON report holds end-to-end and per-stage p50/p95/p99 latency,
+throughput, error counts and the peak RSS sampled during each run, and two
+reports can be diffed with ``python -m benchmarks.compare``.
+
+Usage:
+    python -m benchmarks.run --concurrency 1,4 --requests 8 -o baseline.json
+    python -m benchmarks.run --flows combined --latency-ms 200 --failure-rate 0.1
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fixture_server import FixtureServer
+from benchmarks.stand_ins import (
+    ByteTokenizer,
+    StageRecorder,
+    StubSearch,
+    TinyGemini,
+    install_factcheck_stand_ins,
+    install_summarize_stand_ins,
+    tiny_causal_lm,
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEADLINES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "headlines.json")
+FLOWS = ("combined", "summarize", "graph_data", "factcheck")
+
+sys.path.insert(0, REPO_ROOT)
+
+
+def percentile(values, q):
+    """Linearly interpolated percentile of ``values`` for ``q`` in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarise_latencies(values):
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def process_peak_rss_mb():
+    """Highest RSS over the whole process lifetime, including every earlier run."""
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb():
+    """Current RSS, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+class RssSampler:
+    """Sample the current RSS on a background thread and keep the highest value.
+
+    Unlike ``ru_maxrss`` this covers only the ``with`` block, so each run's
+    peak can be attributed to that flow and concurrency level.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start_mb = self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.start_mb = current_rss_mb()
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_summarize():
+    return importlib.import_module("summarize")
+
+
+def load_factcheck():
+    # Importing the Streamlit script runs its UI code in bare mode; with no
+    # input supplied none of the analysis branches execute.
+    sys.path.insert(0, os.path.join(REPO_ROOT, "Streamlit"))
+    return importlib.import_module("factcheck")
+
+
+def seed_related_summaries(summarize, urls):
+    """Give ``/graph_data`` the kind of related summaries ``/summarize`` stores."""
+    summarize.related_summaries_global = [
+        {"URL": url, "Summary": f"Summary of the source. Accuracy of news: {40 + 7 * i % 60}%"}
+        for i, url in enumerate(urls)
+    ]
+
+
+def factcheck_text_flow(factcheck, text):
+    """The "Text Checker" branch of the Streamlit app without the UI calls."""
+    keywords = factcheck.extract_keywords(text)
+    search_results = factcheck.perform_search(keywords)
+    scraped_data = [[url, factcheck.scrape_important_content(url)] for url in search_results]
+
+    filename = "web_content_summary.csv"
+    factcheck.save_to_csv(scraped_data, filename)
+    corpus = factcheck.read_csv(filename)
+    if corpus:
+        factcheck.get_overall_summary(text)
+    factcheck.fixed(filename, text)
+
+
+def build_flows(names, server, summarize, factcheck):
+    """Return ``{name: callable(headline, index)}`` for the selected flows."""
+    flows = {}
+    article_urls = [url for url in server.urls() if not url.endswith("empty.html")]
+
+    if "combined" in names:
+        flows["combined"] = lambda headline, index: summarize.combinedPipeline(headline)
+
+    if "summarize" in names or "graph_data" in names:
+        # Flask test clients keep per-client state, so each call gets its own
+        def post_summarize(headline, index):
+            response = summarize.app.test_client().post("/summarize", json={
+                "url": article_urls[index % len(article_urls)],
+                "title": headline,
+            })
+            if response.status_code != 200:
+                raise RuntimeError(f"/summarize returned {response.status_code}")
+
+        def get_graph_data(headline, index):
+            response = summarize.app.test_client().get("/graph_data")
+            if response.status_code != 200:
+                raise RuntimeError(f"/graph_data returned {response.status_code}")
+
+        if "summarize" in names:
+            flows["summarize"] = post_summarize
+        if "graph_data" in names:
+            flows["graph_data"] = get_graph_data
+
+    if "factcheck" in names:
+        flows["factcheck"] = lambda headline, index: factcheck_text_flow(factcheck, headline)
+
+    return flows
+
+
+def run_level(flow, concurrency, requests, headlines, recorder):
+    """Run ``requests`` calls of ``flow`` with ``concurrency`` workers."""
+    latencies, errors = [], []
+    recorder.drain()
+
+    def call(index):
+        start = time.perf_counter()
+        try:
+            flow(headlines[index % len(headlines)], index)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    with RssSampler() as rss, ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(call, range(requests)))
+    wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "wall_seconds": wall,
+        "throughput_rps": requests / wall if wall > 0 else None,
+        "latency": summarise_latencies(latencies),
+        "stages": {stage: summarise_latencies(values) for stage, values in sorted(recorder.drain().items())},
+        # Sampled during this run only; None where /proc is unavailable
+        "rss_start_mb": rss.start_mb,
+        "peak_rss_mb": rss.peak_mb,
+        "process_peak_rss_mb": process_peak_rss_mb(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the LiveTruth flows.")
+    parser.add_argument("--flows", default=",".join(FLOWS), help=f"comma-separated subset of {', '.join(FLOWS)}")
+    parser.add_argument("--concurrency", default="1,4", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=8, help="calls per flow and concurrency level")
+    parser.add_argument("--latency-ms", type=float, default=50, help="fixture server base latency")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="extra random fixture latency, up to this much")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="fraction of page fetches answered with 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of page fetches dropped without a response")
+    parser.add_argument("--search-latency-ms", type=float, default=100, help="stub search round trip")
+    parser.add_argument("--max-prompt-tokens", type=int, default=1024, help="stand-in tokenizer model_max_length")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="where to write the JSON report")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = [name.strip() for name in args.flows.split(",") if name.strip()]
+    unknown = set(names) - set(FLOWS)
+    if unknown:
+        raise SystemExit(f"Unknown flows: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    with open(HEADLINES_PATH, encoding="utf-8") as file:
+        headlines = json.load(file)
+
+    recorder = StageRecorder()
+    # Finer stages (tokenize, prefill, decode, download, parse) come from the
+    # pipeline's own tracing spans
+    import telemetry
+    telemetry.subscribe(lambda stage, seconds: recorder.record(f"trace.{stage}", seconds))
+    tokenizer = ByteTokenizer(model_max_length=args.max_prompt_tokens)
+    model = tiny_causal_lm(seed=args.seed, max_positions=args.max_prompt_tokens + 1024)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "runs": [],
+    }
+
+    server = FixtureServer(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        drop_rate=args.drop_rate,
+        seed=args.seed,
+    )
+    # The pipelines write their scratch CSVs to the working directory
+    workdir = tempfile.mkdtemp(prefix="livetruth-bench-")
+    previous_cwd = os.getcwd()
+
+    with server:
+        search = StubSearch(server.urls(), latency_ms=args.search_latency_ms)
+        summarize = factcheck = None
+        if {"combined", "summarize", "graph_data"} & set(names):
+            summarize = load_summarize()
+            install_summarize_stand_ins(summarize, tokenizer, model, search, recorder)
+        if "factcheck" in names:
+            factcheck = load_factcheck()
+            install_factcheck_stand_ins(factcheck, TinyGemini(tokenizer, model), search, recorder)
+
+        os.chdir(workdir)
+        try:
+            for name, flow in build_flows(names, server, summarize, factcheck).items():
+                if name == "graph_data":
+                    # /summarize runs replace these with summaries the stand-in LM made up
+                    seed_related_summaries(summarize, server.urls())
+                for concurrency in levels:
+                    print(f"Running {name} at concurrency {concurrency}...", file=sys.stderr)
+                    result = run_level(flow, concurrency, args.requests, headlines, recorder)
+                    report["runs"].append({"flow": name, **result})
+        finally:
+            os.chdir(previous_cwd)
+
+    report["process_peak_rss_mb"] = process_peak_rss_mb()
+    # The pipelines print freely to stdout, so the report always goes to a file
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
+    print(f"Report written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
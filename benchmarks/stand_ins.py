@@ -0,0 +1,190 @@
+"""Local stand-ins for Google search, Llama-2 and Gemini, plus stage timing."""
+import functools
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+PAD_ID, BOS_ID, EOS_ID = 0, 1, 2
+BYTE_OFFSET = 3
+
+
+class StageRecorder:
+    """Thread-safe collection of per-stage durations in seconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = defaultdict(list)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.durations[stage].append(seconds)
+
+    def timed(self, stage, fn):
+        """Wrap ``fn`` so every call is recorded under ``stage``."""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return wrapper
+
+    def drain(self):
+        with self._lock:
+            durations, self.durations = self.durations, defaultdict(list)
+        return durations
+
+
+class StubSearch:
+    """Deterministic replacement for ``googlesearch.search``.
+
+    Every query maps to the same rotation of fixture URLs, chosen by hashing
+    the query, after sleeping ``latency_ms`` to model the search round trip.
+    """
+
+    def __init__(self, urls, latency_ms=0):
+        self.urls = list(urls)
+        self.latency_ms = latency_ms
+
+    def __call__(self, query, num_results=10, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        start = int(hashlib.md5(query.encode("utf-8")).hexdigest(), 16) % len(self.urls)
+        rotated = self.urls[start:] + self.urls[:start]
+        return rotated[:num_results]
+
+
+class ByteTokenizer:
+    """Byte-level tokenizer exposing the slice of the HF tokenizer API the pipeline uses."""
+
+    pad_token_id = PAD_ID
+    bos_token_id = BOS_ID
+    eos_token_id = EOS_ID
+    pad_token = eos_token = "</s>"
+    vocab_size = 256 + BYTE_OFFSET
+
+    def __init__(self, model_max_length=1024):
+        self.model_max_length = model_max_length
+        self.padding_side = "right"
+
+    def __call__(self, text, return_tensors=None, truncation=False, padding=False, max_length=None):
+        import torch
+
+        texts = [text] if isinstance(text, str) else list(text)
+        rows = [[BOS_ID] + [byte + BYTE_OFFSET for byte in item.encode("utf-8")] for item in texts]
+        limit = max_length or self.model_max_length
+        if truncation:
+            rows = [row[:limit] for row in rows]
+
+        if padding == "max_length":
+            width = limit
+        elif padding:
+            width = max(len(row) for row in rows)
+        else:
+            width = None
+
+        input_ids, attention_mask = [], []
+        for row in rows:
+            pad = [PAD_ID] * (width - len(row)) if width else []
+            mask = [1] * len(row)
+            if self.padding_side == "left":
+                input_ids.append(pad + row)
+                attention_mask.append([0] * len(pad) + mask)
+            else:
+                input_ids.append(row + pad)
+                attention_mask.append(mask + [0] * len(pad))
+
+        return {
+            "input_ids": torch.tensor(input_ids),
+            "attention_mask": torch.tensor(attention_mask),
+        }
+
+    def decode(self, ids, skip_special_tokens=False):
+        ids = ids.tolist() if hasattr(ids, "tolist") else list(ids)
+        data = bytes(i - BYTE_OFFSET for i in ids if i >= BYTE_OFFSET)
+        text = data.decode("utf-8", errors="replace")
+        if not skip_special_tokens:
+            text = "<s>" + text
+        return text
+
+    def batch_decode(self, sequences, skip_special_tokens=False):
+        return [self.decode(ids, skip_special_tokens) for ids in sequences]
+
+
+def tiny_causal_lm(seed=0, max_positions=2048):
+    """Build a two-layer Llama with random weights small enough to run on a CPU."""
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=ByteTokenizer.vocab_size,
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        max_position_embeddings=max_positions,
+        pad_token_id=PAD_ID,
+        bos_token_id=BOS_ID,
+        eos_token_id=EOS_ID,
+    )
+    model = LlamaForCausalLM(config)
+    model.eval()
+    return model
+
+
+class TinyGemini:
+    """Stand-in for ``genai.GenerativeModel`` backed by the tiny causal LM."""
+
+    def __init__(self, tokenizer, model, max_new_tokens=64):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.max_new_tokens = max_new_tokens
+
+    def generate_content(self, prompt):
+        import torch
+
+        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True)
+        with torch.no_grad():
+            outputs = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens, do_sample=False)
+        new_tokens = outputs[0][inputs["input_ids"].shape[1]:]
+        return SimpleNamespace(text=self.tokenizer.decode(new_tokens, skip_special_tokens=True))
+
+
+def install_summarize_stand_ins(summarize, tokenizer, model, search, recorder):
+    """Point ``summarize`` at the stand-ins and time each pipeline stage."""
+    model.generate = recorder.timed("generate", model.generate)
+
+    summarize.initialise_base_model = recorder.timed("load_model", lambda base_model_dir: (tokenizer, model, "cpu"))
+    summarize.initialise_fine_tuned_model = lambda base_model, adapter_dir: base_model
+    summarize.search = recorder.timed("search", search)
+
+    for name, stage in [
+        ("fetch_article", "fetch_article"),
+        ("scrape_important_content", "scrape"),
+        ("process_query", "search_and_scrape"),
+        ("perform_search", "related_search"),
+        ("analyze_news", "phase1_analyze"),
+        ("generate_summary_with_llama", "phase2_summary"),
+        ("combinedPipeline", "combined_pipeline"),
+        ("summarize_text", "summarize_text"),
+    ]:
+        setattr(summarize, name, recorder.timed(stage, getattr(summarize, name)))
+
+
+def install_factcheck_stand_ins(factcheck, gemini, search, recorder):
+    """Point the Streamlit ``factcheck`` module at the stand-ins and time each stage."""
+    factcheck.get_gemini_model = lambda: gemini
+    factcheck.search = recorder.timed("search", search)
+
+    for name, stage in [
+        ("extract_keywords", "keywords"),
+        ("scrape_important_content", "scrape"),
+        ("get_overall_summary", "gemini_summary"),
+        ("fixed", "gemini_per_source"),
+    ]:
+        setattr(factcheck, name, recorder.timed(stage, getattr(factcheck, name)))
@@ -0,0 +1,57 @@
+"""Resolve the NLTK data LiveTruth needs from a directory inside the repo.
+
+Run ``python nltk_resources.py`` once (or while building an image) to vendor
+the resources into ``nltk_data/``; after that nothing touches the network at
+startup. Missing resources are downloaded there on first use as a fallback.
+"""
+import functools
+import os
+
+import nltk
+
+NLTK_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nltk_data")
+
+# Download name -> path nltk.data.find() resolves it by. NLTK 3.8.2 moved
+# word_tokenize from the pickled punkt models to punkt_tab.
+if hasattr(nltk.tokenize.punkt, "PunktTokenizer"):
+    RESOURCES = {"punkt_tab": "tokenizers/punkt_tab"}
+else:
+    RESOURCES = {"punkt": "tokenizers/punkt"}
+RESOURCES["stopwords"] = "corpora/stopwords"
+
+if NLTK_DATA_DIR not in nltk.data.path:
+    nltk.data.path.insert(0, NLTK_DATA_DIR)
+
+
+def missing_resources():
+    missing = []
+    for name, path in RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(name)
+    return missing
+
+
+@functools.lru_cache(maxsize=None)
+def ensure_nltk_data():
+    """Download any missing resource into ``NLTK_DATA_DIR``; return what is still missing."""
+    for name in missing_resources():
+        if not nltk.download(name, download_dir=NLTK_DATA_DIR, quiet=True):
+            print(f"NLTK resource '{name}' is unavailable; run `python nltk_resources.py` with network access")
+    return tuple(missing_resources())
+
+
+@functools.lru_cache(maxsize=None)
+def english_stop_words():
+    """English stopwords, loaded once per process."""
+    ensure_nltk_data()
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+
+if __name__ == "__main__":
+    still_missing = ensure_nltk_data()
+    if still_missing:
+        raise SystemExit(f"Could not fetch: {', '.join(still_missing)}")
+    print(f"NLTK data available in {NLTK_DATA_DIR}")
@@ -0,0 +1,490 @@
+"""Ground-truth verification of headlines by SMS.
+
+Service version of ``Backend Model/gpsSMSverification.ipynb``: pick recipients
+near where a story happened, ask each of them by SMS whether it is true, and
+keep a running yes/no tally per headline as their replies arrive.
+
+* ``RecipientIndex`` is a grid index over recipient locations, so choosing the
+  people within a radius only looks at nearby cells.
+* ``send_bulk`` fans messages out concurrently with a concurrency limit and
+  retries with backoff, against any provider with an async ``send``:
+  ``TwilioProvider`` in production, ``LocalProvider`` for development.
+* ``ClaimTally`` updates counts in O(1) per reply (a repeated reply from the
+  same number replaces the earlier one) and reports a Wilson interval.
+* ``create_blueprint`` exposes it over HTTP, including the Twilio inbound
+  webhook.
+"""
+import asyncio
+import csv
+import hmac
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry import REGISTRY, span
+
+MESSAGE_TEMPLATE = (
+    "As the first-hand person to be affected by the headline {headline}, "
+    "please help us to verify this by resending a YES or a NO."
+)
+RESPONSES_HEADER = ["claim_id", "recipient", "response"]
+EARTH_RADIUS_KM = 6371.0088
+# Same sphere as haversine_km, so the search box never falls inside the circle
+KM_PER_DEGREE = math.radians(1) * EARTH_RADIUS_KM
+
+
+class SendError(Exception):
+    """A message could not be sent; ``retryable`` says whether trying again may help."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class TwilioProvider:
+    """Send through Twilio. The blocking client runs on a dedicated thread pool."""
+
+    def __init__(self, account_sid, auth_token, from_number, max_workers=32):
+        from twilio.rest import Client
+
+        self.client = Client(account_sid, auth_token)
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="twilio")
+
+    def _send(self, to, body):
+        from requests import RequestException
+        from twilio.base.exceptions import TwilioRestException
+
+        try:
+            return self.client.messages.create(body=body, from_=self.from_number, to=to).sid
+        except TwilioRestException as e:
+            # Rate limiting and server errors are worth retrying; a bad number is not
+            raise SendError(str(e), retryable=e.status == 429 or e.status >= 500) from e
+        except (RequestException, OSError) as e:
+            # Connection resets and timeouts from Twilio's HTTP client
+            raise SendError(f"{type(e).__name__}: {e}", retryable=True) from e
+
+    async def send(self, to, body):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._send, to, body)
+
+
+class LocalProvider:
+    """Stand-in provider that records messages instead of sending them.
+
+    ``latency_ms`` and ``failure_rate`` simulate the network round trip and
+    transient gateway errors.
+    """
+
+    def __init__(self, latency_ms=0, failure_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.sent = []
+        self._random = random.Random(seed)
+
+    async def send(self, to, body):
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if self._random.random() < self.failure_rate:
+            raise SendError("Injected failure")
+        sid = f"LOCAL{uuid.uuid4().hex[:16]}"
+        self.sent.append({"sid": sid, "to": to, "body": body})
+        return sid
+
+
+async def send_bulk(provider, numbers, body, concurrency=50, retries=3, backoff=0.5):
+    """Send ``body`` to every number, at most ``concurrency`` at a time.
+
+    Retryable failures are tried up to ``retries`` more times with exponential
+    backoff and jitter. Returns ``{"sent": {number: sid}, "failed": {number: error}}``.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    sent, failed = {}, {}
+
+    async def deliver(number):
+        async with semaphore:
+            for attempt in range(retries + 1):
+                try:
+                    sent[number] = await provider.send(number, body)
+                    REGISTRY.inc("livetruth_sms_sent_total", status="sent")
+                    return
+                except SendError as e:
+                    if not e.retryable or attempt == retries:
+                        failed[number] = str(e)
+                        REGISTRY.inc("livetruth_sms_sent_total", status="failed")
+                        return
+                    REGISTRY.inc("livetruth_sms_retries_total")
+                    await asyncio.sleep(backoff * 2 ** attempt * (0.5 + random.random()))
+                except Exception as e:
+                    # A provider bug must not abort the sends to everyone else
+                    failed[number] = f"{type(e).__name__}: {e}"
+                    REGISTRY.inc("livetruth_sms_sent_total", status="failed")
+                    return
+
+    with span("sms_fanout", recipients=len(numbers)):
+        await asyncio.gather(*(deliver(number) for number in numbers))
+    return {"sent": sent, "failed": failed}
+
+
+def valid_point(lat, lon):
+    """Whether ``(lat, lon)`` are finite coordinates in degrees."""
+    return math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class RecipientIndex:
+    """Grid index of recipient phone numbers by location.
+
+    Recipients are bucketed into ``cell_degrees`` squares, so a radius query
+    only measures distances to recipients in the cells overlapping its
+    bounding box.
+    """
+
+    def __init__(self, cell_degrees=0.1):
+        self.cell_degrees = cell_degrees
+        self._columns = math.ceil(360 / cell_degrees)
+        self._cells = defaultdict(list)
+        self._locations = {}
+
+    def __len__(self):
+        return len(self._locations)
+
+    def _cell(self, lat, lon):
+        return (math.floor((lat + 90) / self.cell_degrees),
+                math.floor((lon + 180) / self.cell_degrees) % self._columns)
+
+    def add(self, number, lat, lon):
+        if not valid_point(lat, lon):
+            raise ValueError(f"Invalid location for {number}: {lat}, {lon}")
+        if number in self._locations:
+            self._cells[self._cell(*self._locations[number])].remove(number)
+        self._locations[number] = (lat, lon)
+        self._cells[self._cell(lat, lon)].append(number)
+
+    def near(self, lat, lon, radius_km, limit=None):
+        """Numbers within ``radius_km`` of the point, nearest first."""
+        lat_span = radius_km / KM_PER_DEGREE
+        # Longitude degrees shrink towards the poles; near them, scan every column
+        cos_lat = math.cos(math.radians(min(abs(lat) + lat_span, 90)))
+        lon_span = radius_km / (KM_PER_DEGREE * cos_lat) if cos_lat > 1e-6 else 180
+
+        low_row, low_column = self._cell(max(lat - lat_span, -90), lon - min(lon_span, 180))
+        high_row, _ = self._cell(min(lat + lat_span, 90), lon)
+        # One cell of slack on every side absorbs rounding at cell edges
+        low_row, high_row, low_column = low_row - 1, high_row + 1, low_column - 1
+        column_count = min(math.ceil(2 * lon_span / self.cell_degrees) + 3, self._columns)
+
+        matches = []
+        for row in range(low_row, high_row + 1):
+            for offset in range(column_count):
+                for number in self._cells.get((row, (low_column + offset) % self._columns), ()):
+                    distance = haversine_km(lat, lon, *self._locations[number])
+                    if distance <= radius_km:
+                        matches.append((distance, number))
+
+        matches.sort()
+        return [number for _, number in matches[:limit]]
+
+    @classmethod
+    def from_csv(cls, path, cell_degrees=0.1):
+        """Build an index from a CSV with ``number``, ``lat`` and ``lon`` columns."""
+        index = cls(cell_degrees)
+        with open(path, newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                index.add(row["number"], float(row["lat"]), float(row["lon"]))
+        return index
+
+
+def classify_reply(body):
+    """Map an SMS reply to ``"yes"``, ``"no"`` or ``"other"``."""
+    words = body.strip().lower().split()
+    word = words[0].strip(".,!?") if words else ""
+    if word in ("yes", "y"):
+        return "yes"
+    if word in ("no", "n"):
+        return "no"
+    return "other"
+
+
+def wilson_interval(successes, total, z=1.96):
+    """Wilson score interval for a binomial proportion (95% by default)."""
+    if total == 0:
+        return 0.0, 1.0
+    p = successes / total
+    denominator = 1 + z * z / total
+    centre = (p + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+class ClaimTally:
+    """Running reply counts for one headline."""
+
+    def __init__(self):
+        self.counts = {"yes": 0, "no": 0, "other": 0}
+        self.answers = {}
+
+    def add(self, number, answer):
+        previous = self.answers.get(number)
+        if previous is not None:
+            self.counts[previous] -= 1
+        self.answers[number] = answer
+        self.counts[answer] += 1
+
+    def summary(self):
+        # As in the notebook, every reply counts towards the total and only
+        # "yes" counts as confirming the headline
+        total = len(self.answers)
+        low, high = wilson_interval(self.counts["yes"], total)
+        return {
+            "responses": total,
+            "counts": dict(self.counts),
+            "probability_of_yes": self.counts["yes"] / total if total else None,
+            "confidence_interval": [low, high],
+        }
+
+
+class VerificationEngine:
+    """Creates claims, fans out the SMS requests and aggregates the replies.
+
+    Replies carry no claim reference, so each number is tied to the most
+    recent claim it was asked about. With ``responses_path`` set, every reply
+    is also appended to that CSV; an existing file must have the same columns.
+    """
+
+    def __init__(self, provider, index, responses_path=None, concurrency=50, retries=3):
+        self.provider = provider
+        self.index = index
+        self.responses_path = responses_path
+        if responses_path:
+            _check_responses_header(responses_path)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.claims = {}
+        self._claim_by_number = {}
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def create_claim(self, headline, lat, lon, radius_km, limit=None):
+        recipients = self.index.near(lat, lon, radius_km, limit)
+        claim_id = uuid.uuid4().hex[:12]
+        claim = {
+            "id": claim_id,
+            "headline": headline,
+            "location": [lat, lon],
+            "radius_km": radius_km,
+            "recipients": recipients,
+            "created": time.time(),
+            "delivery": {"status": "pending"},
+            "tally": ClaimTally(),
+        }
+        with self._lock:
+            self.claims[claim_id] = claim
+            for number in recipients:
+                self._claim_by_number[number] = claim_id
+        return claim
+
+    async def dispatch(self, claim_id):
+        """Send the verification SMS to every recipient of the claim."""
+        claim = self.claims[claim_id]
+        claim["delivery"] = {"status": "sending"}
+        body = MESSAGE_TEMPLATE.format(headline=claim["headline"])
+        # Whatever happens, the claim must not be left reporting "sending"
+        delivery = {"status": "error", "error": "Dispatch was cancelled"}
+        try:
+            result = await send_bulk(
+                self.provider, claim["recipients"], body, concurrency=self.concurrency, retries=self.retries
+            )
+            delivery = {"status": "done", "sent": len(result["sent"]), "failed": result["failed"]}
+            return result
+        except Exception as e:
+            delivery = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            raise
+        finally:
+            claim["delivery"] = delivery
+
+    def dispatch_in_background(self, claim_id):
+        """Schedule ``dispatch`` on the engine's event loop thread and return its future."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="sms-dispatch", daemon=True).start()
+        future = asyncio.run_coroutine_threadsafe(self.dispatch(claim_id), self._loop)
+        future.add_done_callback(_report_dispatch_error)
+        return future
+
+    def record_reply(self, number, body):
+        """Count an inbound reply; returns the claim id it was counted against, or None."""
+        answer = classify_reply(body)
+        with self._lock:
+            claim_id = self._claim_by_number.get(number)
+            if claim_id is None:
+                return None
+            self.claims[claim_id]["tally"].add(number, answer)
+            if self.responses_path:
+                self._append_reply(claim_id, number, answer)
+        REGISTRY.inc("livetruth_sms_replies_total", answer=answer)
+        return claim_id
+
+    def _append_reply(self, claim_id, number, answer):
+        new_file = not os.path.exists(self.responses_path) or os.path.getsize(self.responses_path) == 0
+        with open(self.responses_path, "a", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            if new_file:
+                writer.writerow(RESPONSES_HEADER)
+            writer.writerow([claim_id, number, answer])
+
+    def summary(self, claim_id):
+        claim = self.claims[claim_id]
+        with self._lock:
+            tally = claim["tally"].summary()
+        return {
+            "id": claim_id,
+            "headline": claim["headline"],
+            "recipients": len(claim["recipients"]),
+            "delivery": claim["delivery"],
+            **tally,
+        }
+
+
+def _check_responses_header(path):
+    """Refuse to append to a CSV written with other columns, such as the notebook's ``responses.csv``."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, newline="", encoding="utf-8") as file:
+        header = next(csv.reader(file), [])
+    if header != RESPONSES_HEADER:
+        raise ValueError(
+            f"{path} has columns {header}, expected {RESPONSES_HEADER}; "
+            "point SMS_RESPONSES_CSV at another file"
+        )
+
+
+def _report_dispatch_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"SMS dispatch failed: {future.exception()!r}")
+
+
+def engine_from_env():
+    """Build an engine from the environment.
+
+    Uses Twilio when ``TWILIO_ACCOUNT_SID``, ``TWILIO_AUTH_TOKEN`` and
+    ``TWILIO_FROM_NUMBER`` are set and ``LocalProvider`` otherwise. Recipients
+    come from ``SMS_RECIPIENTS_CSV`` (default ``recipients.csv``) if it exists,
+    and replies are logged to ``SMS_RESPONSES_CSV`` (default
+    ``sms_responses.csv``).
+    """
+    if all(os.environ.get(key) for key in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_FROM_NUMBER")):
+        provider = TwilioProvider(
+            os.environ["TWILIO_ACCOUNT_SID"], os.environ["TWILIO_AUTH_TOKEN"], os.environ["TWILIO_FROM_NUMBER"]
+        )
+    else:
+        provider = LocalProvider()
+
+    recipients_path = os.environ.get("SMS_RECIPIENTS_CSV", "recipients.csv")
+    index = RecipientIndex.from_csv(recipients_path) if os.path.exists(recipients_path) else RecipientIndex()
+    return VerificationEngine(provider, index, responses_path=os.environ.get("SMS_RESPONSES_CSV", "sms_responses.csv"))
+
+
+def create_blueprint(engine=None):
+    """HTTP endpoints for claims and the Twilio inbound-message webhook.
+
+    Without an ``engine``, one is built by ``engine_from_env`` on the first
+    /sms request, so importing the app doesn't set up Twilio or read the
+    recipients file.
+
+    Creating a claim sends paid messages, so it needs an
+    ``Authorization: Bearer <SMS_OPERATOR_TOKEN>`` header. Inbound replies
+    must carry a valid Twilio signature when Twilio is the provider, and the
+    operator token otherwise.
+    """
+    from flask import Blueprint, Response, abort, jsonify, request
+
+    blueprint = Blueprint("sms_verification", __name__, url_prefix="/sms")
+    engine_lock = threading.Lock()
+
+    def get_engine():
+        nonlocal engine
+        with engine_lock:
+            if engine is None:
+                engine = engine_from_env()
+            return engine
+
+    def require_operator():
+        expected = os.environ.get("SMS_OPERATOR_TOKEN")
+        if not expected:
+            abort(503, description="SMS_OPERATOR_TOKEN is not set")
+        supplied = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(supplied.encode("utf-8"), f"Bearer {expected}".encode("utf-8")):
+            abort(401)
+
+    @blueprint.route("/claims", methods=["POST"])
+    def create_claim():
+        """Pick recipients near the news location and start sending."""
+        require_operator()
+        data = request.get_json(silent=True) or {}
+        try:
+            headline = str(data["headline"]).strip()
+            lat, lon = float(data["lat"]), float(data["lon"])
+            radius_km = float(data.get("radius_km", 10))
+            limit = int(data["limit"]) if data.get("limit") is not None else None
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "headline, lat and lon are required"}), 400
+
+        if not headline:
+            return jsonify({"error": "headline must not be empty"}), 400
+        if not valid_point(lat, lon):
+            return jsonify({"error": "lat must be in [-90, 90] and lon in [-180, 180]"}), 400
+        if not math.isfinite(radius_km) or radius_km <= 0:
+            return jsonify({"error": "radius_km must be a positive number"}), 400
+        if limit is not None and limit < 1:
+            return jsonify({"error": "limit must be at least 1; omit it for no limit"}), 400
+
+        engine = get_engine()
+        claim = engine.create_claim(headline, lat, lon, radius_km, limit)
+        if claim["recipients"]:
+            engine.dispatch_in_background(claim["id"])
+        return jsonify(engine.summary(claim["id"])), 202
+
+    @blueprint.route("/claims/<claim_id>", methods=["GET"])
+    def claim_summary(claim_id):
+        """Current tally and delivery status for a claim."""
+        engine = get_engine()
+        if claim_id not in engine.claims:
+            abort(404)
+        return jsonify(engine.summary(claim_id))
+
+    @blueprint.route("/inbound", methods=["POST"])
+    def inbound():
+        """Twilio webhook for replies; answers with empty TwiML."""
+        engine = get_engine()
+        if isinstance(engine.provider, TwilioProvider):
+            try:
+                from twilio.request_validator import RequestValidator
+            except ImportError:
+                abort(503, description="twilio is not installed; cannot validate the request signature")
+            if not engine.provider.auth_token:
+                abort(503, description="No Twilio auth token to validate the request signature with")
+
+            signature = request.headers.get("X-Twilio-Signature", "")
+            if not RequestValidator(engine.provider.auth_token).validate(request.url, request.form, signature):
+                abort(403)
+        else:
+            # Without Twilio, replies can only be simulated by an operator
+            require_operator()
+
+        engine.record_reply(request.form.get("From", ""), request.form.get("Body", ""))
+        return Response("<Response></Response>", mimetype="text/xml")
+
+    return blueprint
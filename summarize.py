@@ -4,28 +4,25 @@ from bs4 import BeautifulSoup
 from flask_cors import CORS
 from googlesearch import search
 import re
-from transformers import (
-    AutoModelForCausalLM,
-    AutoTokenizer,
-    BitsAndBytesConfig,
-    HfArgumentParser,
-    TrainingArguments,
-    pipeline,
-    logging,
-)
-import torch
-from peft import PeftModel
+import os
+import threading
+import time
+from contextlib import contextmanager
 import csv
-import nltk
-from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
-import pandas as pd
-# NLTK setup
-nltk.download('punkt')
-nltk.download('stopwords')
+from nltk_resources import english_stop_words, ensure_nltk_data
+from sms_verification import create_blueprint
+from telemetry import REGISTRY, instrument_app, record, span
+# torch, transformers, peft and pandas are imported where they are used, so
+# the server binds its port without waiting for the ML stack
 
 app = Flask(__name__)
-CORS(app)
+# Any origin may call the pipeline endpoints, but not /sms: a web page must
+# not be able to trigger a mass SMS send from a visitor's browser
+CORS(app, resources={r"^/(?!sms/).*": {"origins": "*"}})
+instrument_app(app)
+# The SMS engine (Twilio client, recipients index) is built on the first /sms request
+app.register_blueprint(create_blueprint())
 
 # Model from Hugging Face hub
 base_model = "NousResearch/Llama-2-7b-chat-hf"
@@ -33,47 +30,182 @@ base_model = "NousResearch/Llama-2-7b-chat-hf"
 #fine-tuned model
 fine_tuned_model = "llama-fine-tuned1/pytorch/default/1"
 
-# Set torch dtype and attention implementation
-if torch.cuda.get_device_capability()[0] >= 8:
-    # !pip install -qqq flash-attn
-    torch_dtype = torch.bfloat16
-    attn_implementation = "flash_attention_2"
-else:
-    torch_dtype = torch.float16
-    attn_implementation = "eager"
-
-# QLoRA config
-bnb_config = BitsAndBytesConfig(
-    load_in_4bit=True,
-    bnb_4bit_quant_type="nf4",
-    bnb_4bit_compute_dtype=torch_dtype,
-    llm_int8_enable_fp32_cpu_offload=True,
-    bnb_4bit_use_double_quant=True,
-)
-
-# Load model
-model = AutoModelForCausalLM.from_pretrained(
-    base_model,
-    quantization_config=bnb_config,
-    device_map="auto",
-    attn_implementation=attn_implementation
-    
+# Loaded models, shared by every request
+_models_lock = threading.Lock()
+_base_models = {}        # base_model_dir -> (tokenizer, model, device)
+_fine_tuned_models = {}  # (id(base model), adapter_dir) -> PeftModel
+
+# Held around generate() so switching the adapter off for one request can't
+# leak into a generation running for another
+_generation_lock = threading.RLock()
+
+# Startup progress reported by /readyz
+_readiness_lock = threading.Lock()
+_readiness = {"status": "idle", "error": None, "attempts": 0, "time_to_ready_seconds": None}
+_process_started = time.time()
+# A failed load is retried by the next /readyz after a backoff doubling from
+# LOAD_RETRY_SECONDS up to LOAD_RETRY_MAX_SECONDS
+LOAD_RETRY_SECONDS = 15
+LOAD_RETRY_MAX_SECONDS = 600
+_next_load_attempt = 0.0
+
+def load_model():
+    """Load the base model, tokenizer and fine-tuned adapter the pipeline uses.
+
+    Returns ``(tokenizer, base_model, fine_tuned_model, device)``. Models are
+    cached, so later calls return the ones already loaded.
+    """
+    tokenizer, base, device = initialise_base_model(base_model)
+    fine_tuned = initialise_fine_tuned_model(base, fine_tuned_model)
+    return tokenizer, base, fine_tuned, device
+
+def _warm_up():
+    global _next_load_attempt
+    try:
+        with span("startup_nltk_data"):
+            missing = ensure_nltk_data()
+            if missing:
+                raise LookupError(f"NLTK data unavailable: {', '.join(missing)}")
+            english_stop_words()
+        with span("startup_imports"):
+            import torch, transformers, peft  # noqa: F401
+        load_model()
+    except Exception as e:
+        # Forget the cached NLTK lookup so the retry downloads again
+        ensure_nltk_data.cache_clear()
+        with _readiness_lock:
+            delay = min(LOAD_RETRY_SECONDS * 2 ** (_readiness["attempts"] - 1), LOAD_RETRY_MAX_SECONDS)
+            _next_load_attempt = time.monotonic() + delay
+            _readiness.update(status="failed", error=f"{type(e).__name__}: {e}")
+        print(f"Model loading failed: {e}; retrying in {delay}s")
+        return
+
+    seconds = time.time() - _process_started
+    REGISTRY.set_gauge("livetruth_time_to_ready_seconds", seconds)
+    print(f"Ready {seconds:.1f}s after start")
+    with _readiness_lock:
+        _readiness.update(status="ready", error=None, time_to_ready_seconds=seconds)
+
+def start_background_loading():
+    """Resolve NLTK data and load the models on a background thread.
+
+    Runs once per process; /readyz starts it too if nothing else has, and
+    restarts it after a failure once the retry backoff has passed.
+    """
+    with _readiness_lock:
+        status = _readiness["status"]
+        if status in ("loading", "ready"):
+            return
+        if status == "failed" and time.monotonic() < _next_load_attempt:
+            return
+        _readiness.update(status="loading", attempts=_readiness["attempts"] + 1)
+    threading.Thread(target=_warm_up, name="model-loader", daemon=True).start()
+
+# Decoding settings shared by every generation call
+GENERATION_KWARGS = dict(
+    num_beams=5,          # Enhance quality with beam search
+    temperature=0.7,      # Balance randomness
+    top_k=40,             # Limit to top-k tokens
+    top_p=0.9,            # Nucleus sampling
+    repetition_penalty=1.2  # Reduce repetitive outputs
 )
 
-# Load tokenizer
-tokenizer = AutoTokenizer.from_pretrained(base_model, trust_remote_code=True)
-tokenizer.pad_token = tokenizer.eos_token
-tokenizer.padding_side = "right"
+# Marker the phase 2 summary is cut at, so the prompt preamble is dropped
+SUMMARY_MARKER = "provide an overall summary in maximum 100 words."
 
 # Store related summaries in a global variable (temporary solution)
 related_summaries_global = []
 
+class _FirstStepTimer:
+    """Logits processor noting when generate() asks for its first logits, i.e. when prefill is done."""
+
+    def __init__(self):
+        self.first_step = None
+
+    def __call__(self, input_ids, scores):
+        if self.first_step is None:
+            self.first_step = time.perf_counter()
+        return scores
+
+def generate_text(input_text, tokenizer, model, device, max_new_tokens):
+    """Tokenize, generate and decode one prompt, tracing each step."""
+    import torch
+    from transformers import LogitsProcessorList
+
+    with span("tokenize") as s:
+        inputs = tokenizer(
+            input_text,
+            return_tensors="pt",
+            truncation=True,
+            padding="max_length",
+        )
+        inputs = {key: value.to(device) for key, value in inputs.items()}
+        s.add("tokens_in", int(inputs["attention_mask"].sum()))
+
+    step_timer = _FirstStepTimer()
+    with _generation_lock:
+        start = time.perf_counter()
+        with torch.no_grad():
+            outputs = model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                logits_processor=LogitsProcessorList([step_timer]),
+                **GENERATION_KWARGS
+            )
+        end = time.perf_counter()
+
+    first_step = step_timer.first_step or end
+    tokens_out = outputs.shape[-1] - inputs["input_ids"].shape[-1]
+    record("prefill", first_step - start, start=start)
+    record("decode", end - first_step, start=first_step, tokens_out=tokens_out)
+
+    with span("detokenize"):
+        response = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    return response.strip()
+
+@contextmanager
+def _without_adapter(base_model, adapter_dir):
+    """Generate with ``base_model`` as published, without the ``adapter_dir`` LoRA adapter PEFT injected into it."""
+    with _models_lock:
+        injected = {d: m for (base_id, d), m in _fine_tuned_models.items() if base_id == id(base_model)}
+    if not injected:
+        yield
+        return
+    # Switching off one of several adapters sharing a base would still leave the others active
+    if set(injected) != {adapter_dir}:
+        raise RuntimeError(f"Expected only {adapter_dir} on the base model, found {sorted(injected)}")
+    with _generation_lock, injected[adapter_dir].disable_adapter():
+        yield
+
 ##FUNCTIONS FOR PIPELINE
 def initialise_base_model(base_model_dir):
+    """Return ``(tokenizer, model, device)`` for ``base_model_dir``, loading it on first use."""
+    with _models_lock:
+        if base_model_dir in _base_models:
+            REGISTRY.inc("livetruth_cache_hits_total", cache="model")
+            return _base_models[base_model_dir]
+        REGISTRY.inc("livetruth_cache_misses_total", cache="model")
+        with span("model_load", model=base_model_dir):
+            _base_models[base_model_dir] = _initialise_base_model(base_model_dir)
+        return _base_models[base_model_dir]
+
+def _initialise_base_model(base_model_dir):
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+
+    # Set torch dtype and attention implementation
+    if torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 8:
+        # !pip install -qqq flash-attn
+        torch_dtype = torch.bfloat16
+        attn_implementation = "flash_attention_2"
+    else:
+        torch_dtype = torch.float16
+        attn_implementation = "eager"
+
     bnb_config = BitsAndBytesConfig(
             load_in_4bit=True,
             bnb_4bit_quant_type="nf4",
-            bnb_4bit_compute_dtype=torch.float16,
+            bnb_4bit_compute_dtype=torch_dtype,
             llm_int8_enable_fp32_cpu_offload=True,
             bnb_4bit_use_double_quant=True,
     )
@@ -82,11 +214,14 @@ def initialise_base_model(base_model_dir):
     base_model = AutoModelForCausalLM.from_pretrained(
             base_model_dir,
             quantization_config=bnb_config,
-            device_map="auto"
+            device_map="auto",
+            attn_implementation=attn_implementation
         )
     
     # Load tokenizer
-    tokenizer = AutoTokenizer.from_pretrained(base_model_dir)
+    tokenizer = AutoTokenizer.from_pretrained(base_model_dir, trust_remote_code=True)
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "right"
 
     device = "cuda" if torch.cuda.is_available() else "cpu"
     base_model = base_model.to(device)
@@ -95,48 +230,44 @@ def initialise_base_model(base_model_dir):
     return tokenizer, base_model, device
 
 def initialise_fine_tuned_model(base_model, adapter_dir):
-    model = PeftModel.from_pretrained(base_model, adapter_dir)
-        
-    # Move Model to Appropriate Device
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model = model.to(device)
-    model.eval()
-    return model
+    """Wrap ``base_model`` with the LoRA adapter in ``adapter_dir``, once per base model."""
+    import torch
+    from peft import PeftModel
+
+    key = (id(base_model), adapter_dir)
+    with _models_lock:
+        if key in _fine_tuned_models:
+            REGISTRY.inc("livetruth_cache_hits_total", cache="model")
+            return _fine_tuned_models[key]
+        REGISTRY.inc("livetruth_cache_misses_total", cache="model")
+
+        with span("model_load", model=adapter_dir):
+            model = PeftModel.from_pretrained(base_model, adapter_dir)
+
+        # Move Model to Appropriate Device
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        model = model.to(device)
+        model.eval()
+        _fine_tuned_models[key] = model
+        return model
 
 
 # PHASE 1 FUNCTIONS
-def analyze_news(headline, tokenizer, model, device):
-    # Input Prompt
-    input_text = (
+def analysis_prompt(headline):
+    """Build the phase 1 prompt for the fine-tuned model."""
+    return (
         "You are a news analyzer. Given the headline, provide a confidence score (0-100) indicating how likely the news is true, "
         "and give a detailed explanation for your assessment. "
         f"Headline: '{headline}'\n"
     )
 
-    # Tokenize Input
-    inputs = tokenizer(
-        input_text,
-        return_tensors="pt",
-        truncation=True,
-        padding="max_length",
-    )
-    inputs = {key: value.to(device) for key, value in inputs.items()}
+def analyze_news(headline, tokenizer, model, device):
+    # Input Prompt
+    input_text = analysis_prompt(headline)
 
     # Generate Response
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=250,   # Limits generated tokens only
-            num_beams=5,          # Enhance quality with beam search
-            temperature=0.7,      # Balance randomness
-            top_k=40,             # Limit to top-k tokens
-            top_p=0.9,            # Nucleus sampling
-            repetition_penalty=1.2  # Reduce repetitive outputs
-        )
-    
-    # Decode and Post-process
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    return response.strip()
+    with span("phase1_analyze"):
+        return generate_text(input_text, tokenizer, model, device, max_new_tokens=250)
 
 
 # PHASE 2 FUNCTIONS
@@ -164,65 +295,57 @@ def scrape_important_content(url):
     except Exception as e:
         return f"Error: {e}"
         
+def extract_keywords(query):
+    """Extract significant keywords from the query using NLTK."""
+    with span("keywords"):
+        stop_words = english_stop_words()
+        words = word_tokenize(query)
+        return [word for word in words if word.isalpha() and word.lower() not in stop_words]
+
 def process_query(query, filename):
     # Step 1: Extract keywords from the query
-    words = word_tokenize(query)
-    stop_words = set(stopwords.words('english'))
-    keywords = [word for word in words if word.isalpha() and word.lower() not in stop_words]
+    keywords = extract_keywords(query)
 
     # Step 2: Perform Google search using extracted keywords
     search_query = " ".join(keywords)
-    search_results = [url for url in search(search_query, num_results=10)]
+    with span("search") as s:
+        search_results = [url for url in search(search_query, num_results=10)]
+        s.add("results", len(search_results))
 
     # Step 3: Scrape content from search results
     scraped_data = []
-    for url in search_results:
-        content = scrape_important_content(url)
-        scraped_data.append([url, content])
+    with span("scrape", pages=len(search_results)):
+        for url in search_results:
+            content = scrape_important_content(url)
+            scraped_data.append([url, content])
 
     # Step 4: Save scraped data to a CSV file
-    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+    with span("write_csv"), open(filename, mode='w', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
         writer.writerow(["URL", "Important Content"])
         writer.writerows(scraped_data)
     return scraped_data
 
+def summary_prompt(corpus):
+    """Build the phase 2 prompt from the scraped page contents."""
+    combined_corpus = "\n".join(corpus)[:4000]  # Limit the input to avoid exceeding model input size
+    return (
+        f"You are a news summarization expert. analyse the data scrapped from web which is: [{combined_corpus}] and {SUMMARY_MARKER}\n"
+    )
+
 def generate_summary_with_llama(file_path,tokenizer,model,device):
+    import pandas as pd
 
-    df = pd.read_csv(file_path)
+    with span("read_csv"):
+        df = pd.read_csv(file_path)
     col = df['Important Content'].tolist()
     corpus = [i for i in col if i not in ("No significant content found.","Failed to fetch content")]
-    
-    combined_corpus = "\n".join(corpus)[:4000]  # Limit the input to avoid exceeding model input size
 
-    input_text = (
-        f"You are a news summarization expert. analyse the data scrapped from web which is: [{combined_corpus}] and provide an overall summary in maximum 100 words.\n"
-    )
-
-    # Tokenize input
-    inputs = tokenizer(
-        input_text,
-        return_tensors="pt",
-        truncation=True,
-        padding="max_length",
-    )
-    inputs = {key: value.to(device) for key, value in inputs.items()}
+    input_text = summary_prompt(corpus)
 
     # Generate response
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=512,   # Limit generated tokens
-            num_beams=5,          # Enhance quality with beam search
-            temperature=0.7,      # Balance randomness
-            top_k=40,             # Limit to top-k tokens
-            top_p=0.9,            # Nucleus sampling
-            repetition_penalty=1.2  # Reduce repetitive outputs
-        )
-
-    # Decode and post-process
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    return response.strip()
+    with span("phase2_summary"):
+        return generate_text(input_text, tokenizer, model, device, max_new_tokens=512)
 
 def combinedPipeline(txt):
     adapter_dir = "llama-fine-tuned1/pytorch/default/1"
@@ -243,8 +366,7 @@ def combinedPipeline(txt):
     # print("\nReading scraped content from CSV and Generating summary using Llama model...")
     filepath = filename
     news_summary = generate_summary_with_llama(filepath,tokenizer,base_model,device)
-    start_index = news_summary.find("provide an overall summary in maximum 100 words."
-    )
+    start_index = news_summary.find(SUMMARY_MARKER)
     if start_index != -1:
         news_summary = news_summary[start_index:]
     # print(news_summary)
@@ -255,11 +377,14 @@ def combinedPipeline(txt):
 def fetch_article(url):
     """Fetch the article text from the given URL."""
     try:
-        response = requests.get(url, timeout=10)
+        with span("download") as s:
+            response = requests.get(url, timeout=10)
+            s.add("bytes_downloaded", len(response.content))
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        paragraphs = soup.find_all('p')
-        article_text = ' '.join([para.get_text() for para in paragraphs])
+        with span("parse"):
+            soup = BeautifulSoup(response.text, 'html.parser')
+            paragraphs = soup.find_all('p')
+            article_text = ' '.join([para.get_text() for para in paragraphs])
         return article_text.strip() or None
     except requests.exceptions.RequestException as e:
         print(f"Error fetching the article: {e}")
@@ -275,30 +400,9 @@ def summarize_text(article_text):
         input_text = (
         f"You are a news analyser. under the result from a fine tuned LLM which is [{fine_tune_response}] and the data scrapped from web which is: [{news_summary}] and provide an overall resultt that whether the news is true and false and a confidence score to it for the headline [{headline}].\n")
 
-        # Tokenize input
-        inputs = tokenizer(
-            input_text,
-            return_tensors="pt",
-            truncation=True,
-            padding="max_length",
-        )
-        inputs = {key: value.to(device) for key, value in inputs.items()}
-
         # Generate response
-        with torch.no_grad():
-            outputs = base_model.generate(
-                **inputs,
-                max_new_tokens=512,   # Limit generated tokens
-                num_beams=5,          # Enhance quality with beam search
-                temperature=0.7,      # Balance randomness
-                top_k=40,             # Limit to top-k tokens
-                top_p=0.9,            # Nucleus sampling
-                repetition_penalty=1.2  # Reduce repetitive outputs
-            )
-
-        # Decode and post-process
-        response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        return response.strip()
+        with _without_adapter(base_model, fine_tuned_model), span("phase3_verdict"):
+            return generate_text(input_text, tokenizer, base_model, device, max_new_tokens=512)
     except Exception as e:
         print(f"Error during summarization: {e}")
         return None
@@ -309,22 +413,31 @@ def perform_search(keywords):
     print(f"Searching for: {search_query}\n")
 
     try:
-        return list(search(search_query, num_results=10))
+        with span("search") as s:
+            results = list(search(search_query, num_results=10))
+            s.add("results", len(results))
+        return results
     except Exception as e:
         print(f"Error during search: {e}")
         return []
 
-def scrape_important_content(url):
-    """Scrape the important content (headings and paragraphs) from the given URL."""
+def scrape_important_content(url, session=None):
+    """Scrape the important content (headings and paragraphs) from the given URL.
+
+    Pass a ``requests.Session`` to reuse pooled connections across calls.
+    """
     try:
-        response = requests.get(url, timeout=10)
+        with span("download") as s:
+            response = (session or requests).get(url, timeout=10)
+            s.add("bytes_downloaded", len(response.content))
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, "html.parser")
-        headings = soup.find_all(['h1', 'h2', 'h3'])
-        paragraphs = soup.find_all('p')
+        with span("parse"):
+            soup = BeautifulSoup(response.content, "html.parser")
+            headings = soup.find_all(['h1', 'h2', 'h3'])
+            paragraphs = soup.find_all('p')
 
-        content = " ".join(h.get_text(strip=True) for h in headings) + " "
-        content += " ".join(p.get_text(strip=True) for p in paragraphs[:8])
+            content = " ".join(h.get_text(strip=True) for h in headings) + " "
+            content += " ".join(p.get_text(strip=True) for p in paragraphs[:8])
 
         return content.strip() or "No significant content found."
     except Exception as e:
@@ -336,6 +449,25 @@ def home():
     """Render the home page."""
     return render_template('home.html')
 
+@app.route('/healthz')
+def healthz():
+    """Liveness probe: the process is up and serving requests."""
+    return jsonify({"status": "ok", "uptime_seconds": time.time() - _process_started})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness probe: 200 once NLTK data and the models are loaded, 503 until then.
+
+    Polling it also retries a failed load once its backoff has passed.
+    """
+    start_background_loading()
+    with _readiness_lock:
+        state = dict(_readiness)
+        if state["status"] == "failed":
+            state["retry_in_seconds"] = max(0.0, _next_load_attempt - time.monotonic())
+    state["uptime_seconds"] = time.time() - _process_started
+    return jsonify(state), 200 if state["status"] == "ready" else 503
+
 @app.route('/summarize', methods=['POST'])
 def summarize_article():
     """Endpoint to fetch and summarize an article."""
@@ -376,29 +508,9 @@ def summarize_article():
                     f"Summarize this: {content} in 50 words and verify accuracy of news in percentage {main_summary} based on this.\n"
                 )
 
-                # Tokenize input
-                inputs = tokenizer(
-                    input_text,
-                    return_tensors="pt",
-                    truncation=True,
-                    padding="max_length"
-                )
-                inputs = {key: value.to(device) for key, value in inputs.items()}
-
                 # Generate response
-                with torch.no_grad():
-                    outputs = base_model.generate(
-                        **inputs,
-                        max_new_tokens=512,   # Limit generated tokens
-                        num_beams=5,          # Enhance quality with beam search
-                        temperature=0.7,      # Balance randomness
-                        top_k=40,             # Limit to top-k tokens
-                        top_p=0.9,            # Nucleus sampling
-                        repetition_penalty=1.2  # Reduce repetitive outputs
-                    )
-
-                # Decode and post-process
-                response = tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
+                with _without_adapter(base_model, fine_tuned_model), span("related_summary"):
+                    response = generate_text(input_text, tokenizer, base_model, device, max_new_tokens=512)
                 summary = response or "No summary generated."
                 related_summaries.append({'URL': result_url, 'Summary': summary})
             except Exception as e:
@@ -453,4 +565,8 @@ def graph_data():
 
 
 if __name__ == '__main__':
+    # The debug reloader serves from a child process (WERKZEUG_RUN_MAIN set);
+    # only that one should load the model
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_loading()
     app.run(debug=True)
@@ -0,0 +1,262 @@
+"""Tracing spans and Prometheus-style metrics for the LiveTruth pipeline.
+
+Wrap each stage in ``span(name)``; the duration lands in a latency histogram,
+counts added with ``Span.add`` (tokens, bytes, cache hits) land in counters,
+and the in-flight gauge tracks concurrently running stages. ``instrument_app``
+adds request metrics, a ``/metrics`` endpoint and the per-request profiler to
+a Flask app.
+
+A request is profiled when ``LIVETRUTH_PROFILE_TOKEN`` is set and the request
+carries it in an ``X-Profile`` header, or when ``LIVETRUTH_PROFILE_SLOW_MS`` is
+set and it runs longer than that. Its timeline is written to ``LIVETRUTH_PROFILE_DIR`` (default
+``profiles/``) in Chrome trace format, viewable in Perfetto or chrome://tracing.
+"""
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+STAGE_SECONDS = "livetruth_stage_duration_seconds"
+STAGE_IN_FLIGHT = "livetruth_stage_in_flight"
+REQUEST_SECONDS = "livetruth_http_request_duration_seconds"
+REQUESTS_IN_FLIGHT = "livetruth_http_requests_in_flight"
+
+
+class Registry:
+    """Thread-safe store of counters, gauges and histograms keyed by label set."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = defaultdict(lambda: defaultdict(float))
+        self._gauges = defaultdict(lambda: defaultdict(float))
+        self._histograms = defaultdict(dict)
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self._counters[name][_label_key(labels)] += amount
+
+    def gauge_add(self, name, amount, **labels):
+        with self._lock:
+            self._gauges[name][_label_key(labels)] += amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[name][_label_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms[name].get(key)
+            if series is None:
+                series = self._histograms[name][key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(metrics.items()):
+                    self._header(lines, name, kind)
+                    for key, value in sorted(series.items()):
+                        lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+            for name, series in sorted(self._histograms.items()):
+                self._header(lines, name, "histogram")
+                for key, data in sorted(series.items()):
+                    for bound, count in zip(self.buckets, data["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {data['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(data['sum'])}")
+                    lines.append(f"{name}_count{_format_labels(key)} {data['count']}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, name, kind):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+REGISTRY = Registry()
+REGISTRY.describe(STAGE_SECONDS, "Time spent in each pipeline stage.")
+REGISTRY.describe(STAGE_IN_FLIGHT, "Pipeline stages currently running.")
+REGISTRY.describe(REQUEST_SECONDS, "HTTP request latency by endpoint.")
+REGISTRY.describe(REQUESTS_IN_FLIGHT, "HTTP requests currently being served.")
+
+_local = threading.local()
+_listeners = []
+
+
+def subscribe(listener):
+    """Call ``listener(stage, seconds)`` whenever a span finishes."""
+    _listeners.append(listener)
+
+
+class Span:
+    """A running stage. ``add`` accumulates counts, ``set`` records attributes."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.counts = defaultdict(int)
+        self.attrs = {}
+
+    def add(self, key, amount=1):
+        self.counts[key] += amount
+
+    def set(self, key, value):
+        self.attrs[key] = value
+
+
+@contextmanager
+def span(stage, **attrs):
+    """Time the enclosed block as ``stage``."""
+    current = Span(stage)
+    current.attrs.update(attrs)
+    REGISTRY.gauge_add(STAGE_IN_FLIGHT, 1, stage=stage)
+    start = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.set("error", type(e).__name__)
+        raise
+    finally:
+        REGISTRY.gauge_add(STAGE_IN_FLIGHT, -1, stage=stage)
+        record(stage, time.perf_counter() - start, start=start, attrs=current.attrs, **current.counts)
+
+
+def record(stage, seconds, start=None, attrs=None, **counts):
+    """Record a stage measured elsewhere, e.g. prefill and decode split out of one ``generate`` call."""
+    REGISTRY.observe(STAGE_SECONDS, seconds, stage=stage)
+    for key, amount in counts.items():
+        REGISTRY.inc(f"livetruth_stage_{key}_total", amount, stage=stage)
+
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.add(stage, time.perf_counter() - seconds if start is None else start, seconds, dict(attrs or {}, **counts))
+
+    for listener in _listeners:
+        listener(stage, seconds)
+
+
+class Trace:
+    """Timeline of the spans finished on one thread while it serves a request."""
+
+    def __init__(self, name):
+        self.name = name
+        self.id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.events = []
+
+    def add(self, stage, start, seconds, args):
+        self.events.append({
+            "name": stage,
+            "ph": "X",
+            "ts": round((start - self.started) * 1e6),
+            "dur": round(seconds * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+
+    def dump(self, directory, **metadata):
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.wall_started))
+        safe_name = "".join(c if c.isalnum() else "_" for c in self.name)
+        path = os.path.join(directory, f"{stamp}-{safe_name}-{self.id}.json")
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({
+                "traceEvents": sorted(self.events, key=lambda event: event["ts"]),
+                "metadata": dict(metadata, name=self.name, id=self.id),
+            }, file, indent=1)
+        return path
+
+
+def start_trace(name):
+    _local.trace = Trace(name)
+    return _local.trace
+
+
+def finish_trace():
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    return trace
+
+
+def instrument_app(app, registry=REGISTRY):
+    """Add request metrics, the ``/metrics`` endpoint and request profiling to ``app``."""
+    from flask import Response, g, request
+
+    slow_ms = float(os.environ.get("LIVETRUTH_PROFILE_SLOW_MS", 0))
+    # Each profile is a file on disk, so clients may only ask for one with the shared secret
+    profile_token = os.environ.get("LIVETRUTH_PROFILE_TOKEN", "")
+    profile_dir = os.environ.get("LIVETRUTH_PROFILE_DIR", "profiles")
+
+    @app.before_request
+    def _start_request():
+        g.telemetry_endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        g.telemetry_started = time.perf_counter()
+        g.telemetry_profile = bool(profile_token) and hmac.compare_digest(
+            request.headers.get("X-Profile", "").encode("utf-8"), profile_token.encode("utf-8")
+        )
+        if g.telemetry_profile or slow_ms:
+            start_trace(f"{request.method} {g.telemetry_endpoint}")
+        registry.gauge_add(REQUESTS_IN_FLIGHT, 1, endpoint=g.telemetry_endpoint)
+
+    @app.after_request
+    def _tag_response(response):
+        g.telemetry_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        if not hasattr(g, "telemetry_started"):
+            return
+        seconds = time.perf_counter() - g.telemetry_started
+        endpoint = g.telemetry_endpoint
+        status = getattr(g, "telemetry_status", 500)
+        registry.gauge_add(REQUESTS_IN_FLIGHT, -1, endpoint=endpoint)
+        registry.observe(REQUEST_SECONDS, seconds, endpoint=endpoint, method=request.method, status=status)
+
+        trace = finish_trace()
+        if trace is not None and (g.telemetry_profile or seconds * 1000 >= slow_ms):
+            trace.add("request", trace.started, seconds, {"endpoint": endpoint, "status": status})
+            path = trace.dump(profile_dir, endpoint=endpoint, status=status, seconds=seconds)
+            print(f"Request profile written to {path}")
+
+    @app.route("/metrics")
+    def metrics():
+        """Expose pipeline and request metrics for Prometheus."""
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+    return app
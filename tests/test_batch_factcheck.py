@@ -0,0 +1,145 @@
+"""Unit tests for the resume, dedupe and caching helpers of ``batch_factcheck``.
+
+Run with ``python -m pytest tests``; nothing here loads a model or touches the
+network.
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_factcheck import (  # noqa: E402
+    PageCache,
+    SearchError,
+    SearchLimiter,
+    dedupe_headlines,
+    headline_id,
+    load_completed,
+)
+
+
+def record_line(key, **fields):
+    return json.dumps({"id": key, "headline": f"headline {key}", **fields}, ensure_ascii=False) + "\n"
+
+
+class LoadCompletedTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "results.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, text):
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(text)
+
+    def read(self):
+        with open(self.path, encoding="utf-8") as file:
+            return file.read()
+
+    def test_missing_file(self):
+        self.assertEqual(load_completed(self.path), set())
+
+    def test_error_records_are_not_done(self):
+        self.write(record_line("a") + record_line("b", error="Search failed") + record_line("c"))
+        self.assertEqual(load_completed(self.path), {"a", "c"})
+
+    def test_truncates_partial_last_line(self):
+        complete = record_line("a") + record_line("b")
+        self.write(complete + record_line("c")[:20])
+        self.assertEqual(load_completed(self.path), {"a", "b"})
+        self.assertEqual(self.read(), complete)
+
+    def test_terminates_complete_last_record_missing_its_newline(self):
+        complete = record_line("a") + record_line("b")
+        self.write(complete.rstrip("\n"))
+        self.assertEqual(load_completed(self.path), {"a", "b"})
+        self.assertEqual(self.read(), complete)
+
+        # The resumed run's appends then start on a line of their own
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(record_line("c"))
+        self.assertEqual(load_completed(self.path), {"a", "b", "c"})
+
+    def test_refuses_to_modify_other_files(self):
+        for text in [
+            "headline,source\nfoo,bar\n",
+            record_line("a") + "not json\n" + record_line("b"),
+            record_line("a") + '{"headline": "no id"}\n',
+            "plain text without a newline",
+        ]:
+            self.write(text)
+            with self.assertRaises(ValueError):
+                load_completed(self.path)
+            self.assertEqual(self.read(), text)
+
+
+class DedupeHeadlinesTest(unittest.TestCase):
+    def test_counts_case_and_whitespace_variants_once(self):
+        result = dedupe_headlines([
+            "Storm hits coast",
+            "  storm   HITS coast ",
+            "",
+            "   ",
+            "Markets rally",
+            "Storm hits coast",
+        ])
+        self.assertEqual(result, [
+            (headline_id("Storm hits coast"), "Storm hits coast", 3),
+            (headline_id("Markets rally"), "Markets rally", 1),
+        ])
+
+    def test_ids_are_stable(self):
+        self.assertEqual(headline_id("A  b"), headline_id("a b"))
+        self.assertNotEqual(headline_id("a b"), headline_id("a c"))
+
+
+class PageCacheTest(unittest.TestCase):
+    def test_hits_misses_and_eviction(self):
+        fetched = []
+        cache = PageCache(lambda url: fetched.append(url) or f"content of {url}", maxsize=2)
+        for url in ["a", "b", "a", "c", "b"]:
+            self.assertEqual(cache(url), f"content of {url}")
+        # "b" was least recently used when "c" arrived, so it is fetched again
+        self.assertEqual(fetched, ["a", "b", "c", "b"])
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+    def test_failures_are_not_cached(self):
+        responses = iter([None, "Failed to fetch content", "content"])
+        cache = PageCache(lambda url: next(responses), maxsize=10)
+        self.assertIsNone(cache("a"))
+        self.assertEqual(cache("a"), "Failed to fetch content")
+        self.assertEqual(cache("a"), "content")
+        self.assertEqual(cache("a"), "content")
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+
+class SearchLimiterTest(unittest.TestCase):
+    def test_retries_then_succeeds(self):
+        attempts = []
+
+        def search(query, num_results=10):
+            attempts.append(query)
+            if len(attempts) < 3:
+                raise RuntimeError("429 Too Many Requests")
+            return ["https://example.com"]
+
+        limiter = SearchLimiter(search, concurrency=1, retries=3, backoff=0)
+        self.assertEqual(limiter("storm"), ["https://example.com"])
+        self.assertEqual(len(attempts), 3)
+
+    def test_raises_after_last_retry(self):
+        def search(query, num_results=10):
+            raise RuntimeError("429 Too Many Requests")
+
+        limiter = SearchLimiter(search, concurrency=1, retries=2, backoff=0)
+        with self.assertRaises(SearchError):
+            limiter("storm")
+
+
+if __name__ == "__main__":
+    unittest.main()
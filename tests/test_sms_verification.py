@@ -0,0 +1,227 @@
+"""Unit tests for the pure parts of ``sms_verification``.
+
+Run with ``python -m pytest tests``; nothing here needs Flask, Twilio or the
+network.
+"""
+import asyncio
+import csv
+import math
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sms_verification import (  # noqa: E402
+    RESPONSES_HEADER,
+    ClaimTally,
+    LocalProvider,
+    RecipientIndex,
+    SendError,
+    VerificationEngine,
+    classify_reply,
+    haversine_km,
+    send_bulk,
+    wilson_interval,
+)
+
+
+class WilsonIntervalTest(unittest.TestCase):
+    def test_no_responses_is_uninformative(self):
+        self.assertEqual(wilson_interval(0, 0), (0.0, 1.0))
+
+    def test_known_value(self):
+        # 8 of 10 at 95%: the textbook interval is about [0.490, 0.943]
+        low, high = wilson_interval(8, 10)
+        self.assertAlmostEqual(low, 0.4902, places=3)
+        self.assertAlmostEqual(high, 0.9433, places=3)
+
+    def test_bounds_stay_in_unit_interval(self):
+        for successes, total in [(0, 5), (5, 5), (1, 1), (0, 1000), (1000, 1000)]:
+            low, high = wilson_interval(successes, total)
+            self.assertGreaterEqual(low, 0.0)
+            self.assertLessEqual(high, 1.0)
+            self.assertTrue(low <= successes / total <= high)
+
+    def test_narrows_with_more_responses(self):
+        small = wilson_interval(5, 10)
+        large = wilson_interval(500, 1000)
+        self.assertLess(large[1] - large[0], small[1] - small[0])
+
+
+class RecipientIndexTest(unittest.TestCase):
+    def brute_force(self, points, lat, lon, radius_km):
+        matches = sorted(
+            (haversine_km(lat, lon, plat, plon), number)
+            for number, (plat, plon) in points.items()
+            if haversine_km(lat, lon, plat, plon) <= radius_km
+        )
+        return [number for _, number in matches]
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        index = RecipientIndex(cell_degrees=0.5)
+        points = {}
+        for i in range(3000):
+            number = f"+1{i:09d}"
+            points[number] = (rng.uniform(-89.9, 89.9), rng.uniform(-180, 180))
+            index.add(number, *points[number])
+
+        queries = [(rng.uniform(-89, 89), rng.uniform(-180, 180)) for _ in range(40)]
+        # Antimeridian and polar queries exercise the column wrap-around
+        queries += [(0.0, 179.9), (0.0, -179.9), (89.5, 0.0), (-89.5, 120.0)]
+        for lat, lon in queries:
+            for radius_km in (50, 500, 3000):
+                self.assertEqual(index.near(lat, lon, radius_km), self.brute_force(points, lat, lon, radius_km))
+
+    def test_finds_points_just_inside_radius_across_cell_edges(self):
+        index = RecipientIndex(cell_degrees=0.1)
+        km_per_degree = haversine_km(0.0, 0.0, 1.0, 0.0)
+        # Centres just south of a row edge, so the point 99.96 km north lands in the next row
+        for centre in (0.0012, 45.0012, -29.9988):
+            index.add("north", centre + 99.96 / km_per_degree, 0.0)
+            self.assertLessEqual(haversine_km(centre, 0.0, *index._locations["north"]), 100)
+            self.assertEqual(index.near(centre, 0.0, 100), ["north"])
+
+        # A large radius widens the gap between the box and the circle
+        index = RecipientIndex(cell_degrees=0.1)
+        index.add("far", 2999 / km_per_degree, 10.0)
+        self.assertEqual(index.near(0.0, 10.0, 3000), ["far"])
+
+    def test_limit_keeps_nearest(self):
+        index = RecipientIndex()
+        index.add("far", 0.0, 0.05)
+        index.add("near", 0.0, 0.01)
+        index.add("out", 0.0, 1.0)
+        self.assertEqual(index.near(0.0, 0.0, 10), ["near", "far"])
+        self.assertEqual(index.near(0.0, 0.0, 10, limit=1), ["near"])
+
+    def test_re_adding_moves_recipient(self):
+        index = RecipientIndex()
+        index.add("a", 10.0, 10.0)
+        index.add("a", -10.0, -10.0)
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.near(10.0, 10.0, 50), [])
+        self.assertEqual(index.near(-10.0, -10.0, 50), ["a"])
+
+    def test_rejects_invalid_locations(self):
+        index = RecipientIndex()
+        for lat, lon in [(math.nan, 0.0), (0.0, math.inf), (91.0, 0.0), (0.0, -181.0)]:
+            with self.assertRaises(ValueError):
+                index.add("x", lat, lon)
+        self.assertEqual(len(index), 0)
+
+
+class ClaimTallyTest(unittest.TestCase):
+    def test_classify_reply(self):
+        self.assertEqual(classify_reply(" Yes!"), "yes")
+        self.assertEqual(classify_reply("n"), "no")
+        self.assertEqual(classify_reply("NO, that's false"), "no")
+        self.assertEqual(classify_reply("maybe"), "other")
+        self.assertEqual(classify_reply(""), "other")
+
+    def test_repeated_reply_replaces_earlier_one(self):
+        tally = ClaimTally()
+        tally.add("+1", "yes")
+        tally.add("+2", "no")
+        tally.add("+1", "no")
+        summary = tally.summary()
+        self.assertEqual(summary["responses"], 2)
+        self.assertEqual(summary["counts"], {"yes": 0, "no": 2, "other": 0})
+        self.assertEqual(summary["probability_of_yes"], 0.0)
+
+    def test_empty_summary(self):
+        summary = ClaimTally().summary()
+        self.assertEqual(summary["responses"], 0)
+        self.assertIsNone(summary["probability_of_yes"])
+        self.assertEqual(summary["confidence_interval"], [0.0, 1.0])
+
+
+class FlakyProvider:
+    """Fails the first ``failures`` sends to each number with ``error``."""
+
+    def __init__(self, failures, error):
+        self.failures = failures
+        self.error = error
+        self.attempts = {}
+
+    async def send(self, to, body):
+        self.attempts[to] = self.attempts.get(to, 0) + 1
+        if self.attempts[to] <= self.failures:
+            raise self.error
+        return f"SID{to}"
+
+
+class SendBulkTest(unittest.TestCase):
+    def test_retries_transient_failures(self):
+        provider = FlakyProvider(2, SendError("busy"))
+        result = asyncio.run(send_bulk(provider, ["a", "b"], "body", retries=3, backoff=0))
+        self.assertEqual(result, {"sent": {"a": "SIDa", "b": "SIDb"}, "failed": {}})
+
+    def test_permanent_failure_is_not_retried(self):
+        provider = FlakyProvider(1, SendError("bad number", retryable=False))
+        result = asyncio.run(send_bulk(provider, ["a"], "body", backoff=0))
+        self.assertEqual(result["failed"], {"a": "bad number"})
+        self.assertEqual(provider.attempts["a"], 1)
+
+    def test_unexpected_error_fails_only_that_number(self):
+        class PartlyBroken:
+            async def send(self, to, body):
+                if to == "bad":
+                    raise ConnectionError("reset")
+                return "SID"
+
+        result = asyncio.run(send_bulk(PartlyBroken(), ["good", "bad"], "body", backoff=0))
+        self.assertEqual(result["sent"], {"good": "SID"})
+        self.assertIn("ConnectionError", result["failed"]["bad"])
+
+
+class VerificationEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.index = RecipientIndex()
+        self.index.add("+1", 51.5, -0.12)
+        self.index.add("+2", 51.51, -0.13)
+        self.directory = tempfile.TemporaryDirectory()
+        self.responses_path = os.path.join(self.directory.name, "sms_responses.csv")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_dispatch_and_replies(self):
+        engine = VerificationEngine(LocalProvider(seed=0), self.index, responses_path=self.responses_path)
+        claim = engine.create_claim("Flooding on the high street", 51.5, -0.12, 5)
+        asyncio.run(engine.dispatch(claim["id"]))
+
+        self.assertEqual(engine.record_reply("+1", "YES"), claim["id"])
+        self.assertIsNone(engine.record_reply("+999", "yes"))
+        summary = engine.summary(claim["id"])
+        self.assertEqual(summary["delivery"]["status"], "done")
+        self.assertEqual(summary["delivery"]["sent"], 2)
+        self.assertEqual(summary["counts"]["yes"], 1)
+
+        with open(self.responses_path, newline="", encoding="utf-8") as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows, [RESPONSES_HEADER, [claim["id"], "+1", "yes"]])
+
+    def test_dispatch_failure_leaves_terminal_status(self):
+        class Broken:
+            async def send(self, to, body):
+                raise asyncio.CancelledError
+
+        engine = VerificationEngine(Broken(), self.index)
+        claim = engine.create_claim("headline", 51.5, -0.12, 5)
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(engine.dispatch(claim["id"]))
+        self.assertEqual(engine.summary(claim["id"])["delivery"]["status"], "error")
+
+    def test_refuses_responses_file_with_other_columns(self):
+        with open(self.responses_path, "w", newline="", encoding="utf-8") as file:
+            csv.writer(file).writerow(["Recipient", "Response"])
+        with self.assertRaises(ValueError):
+            VerificationEngine(LocalProvider(), self.index, responses_path=self.responses_path)
+
+
+if __name__ == "__main__":
+    unittest.main()